@@ -0,0 +1,138 @@
+"""
+Small compiled numeric kernels for the per-tick robot control math.
+
+The inputs here are 3- and 6-element vectors, where NumPy's ufunc dispatch
+costs far more than the handful of flops involved. The kernels are compiled
+with numba when it is available and fall back to the plain Python
+definitions otherwise, which compute the same values.
+"""
+import math
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+
+        def decorator(func):
+            return func
+
+        return decorator
+
+_DEG2RAD = math.pi / 180.0
+_RAD2DEG = 180.0 / math.pi
+# Cutoff for the gimbal-lock branch, as in transformations.py.
+_EPS = 2.220446049250313e-16 * 4.0
+
+
+@njit(cache=True, fastmath=True)
+def build_transformation_matrix(ai, aj, ak, px, py, pz, out):
+    """
+    Write the 4x4 matrix combining the rotation Rz(ak) @ Ry(aj) @ Rx(ai) with the
+    translation (px, py, pz) into out. Angles are in radians.
+    """
+    si, sj, sk = math.sin(ai), math.sin(aj), math.sin(ak)
+    ci, cj, ck = math.cos(ai), math.cos(aj), math.cos(ak)
+    cc, cs = ci * ck, ci * sk
+    sc, ss = si * ck, si * sk
+
+    out[0, 0] = cj * ck
+    out[0, 1] = sj * sc - cs
+    out[0, 2] = sj * cc + ss
+    out[0, 3] = px
+    out[1, 0] = cj * sk
+    out[1, 1] = sj * ss + cc
+    out[1, 2] = sj * cs - sc
+    out[1, 3] = py
+    out[2, 0] = -sj
+    out[2, 1] = cj * si
+    out[2, 2] = cj * ci
+    out[2, 3] = pz
+    out[3, 0] = 0.0
+    out[3, 1] = 0.0
+    out[3, 2] = 0.0
+    out[3, 3] = 1.0
+
+
+@njit(cache=True, fastmath=True)
+def three_trackers_to_robot(m_tracker_to_robot, coord, out):
+    """
+    Transform a batch of tracker coordinates into the robot frame in one compiled
+    pass: build each 'rzyx' transformation matrix, apply m_tracker_to_robot and
+    extract the translation and 'rzyx' Euler angles (degrees) into out.
+    :param m_tracker_to_robot: A 4x4 affine transformation matrix.
+    :param coord: An (n, 6) array of x, y, z, a, b, g tracker coordinates.
+    :param out: An (n, 6) array the results are written into.
+    """
+    m = m_tracker_to_robot
+    for i in range(coord.shape[0]):
+        a = coord[i, 3] * _DEG2RAD
+        b = coord[i, 4] * _DEG2RAD
+        g = coord[i, 5] * _DEG2RAD
+        # 'rzyx' is the 'sxyz' product with the first and last angles swapped.
+        si, sj, sk = math.sin(g), math.sin(b), math.sin(a)
+        ci, cj, ck = math.cos(g), math.cos(b), math.cos(a)
+        cc, cs = ci * ck, ci * sk
+        sc, ss = si * ck, si * sk
+
+        r00 = cj * ck
+        r01 = sj * sc - cs
+        r02 = sj * cc + ss
+        r10 = cj * sk
+        r11 = sj * ss + cc
+        r12 = sj * cs - sc
+        r20 = -sj
+        r21 = cj * si
+        r22 = cj * ci
+        tx = coord[i, 0]
+        ty = coord[i, 1]
+        tz = coord[i, 2]
+
+        # The needed entries of m_tracker_to_robot @ M_tracker, unrolled.
+        p00 = m[0, 0] * r00 + m[0, 1] * r10 + m[0, 2] * r20
+        p10 = m[1, 0] * r00 + m[1, 1] * r10 + m[1, 2] * r20
+        p20 = m[2, 0] * r00 + m[2, 1] * r10 + m[2, 2] * r20
+        p11 = m[1, 0] * r01 + m[1, 1] * r11 + m[1, 2] * r21
+        p21 = m[2, 0] * r01 + m[2, 1] * r11 + m[2, 2] * r21
+        p12 = m[1, 0] * r02 + m[1, 1] * r12 + m[1, 2] * r22
+        p22 = m[2, 0] * r02 + m[2, 1] * r12 + m[2, 2] * r22
+
+        out[i, 0] = m[0, 0] * tx + m[0, 1] * ty + m[0, 2] * tz + m[0, 3]
+        out[i, 1] = m[1, 0] * tx + m[1, 1] * ty + m[1, 2] * tz + m[1, 3]
+        out[i, 2] = m[2, 0] * tx + m[2, 1] * ty + m[2, 2] * tz + m[2, 3]
+
+        cy = math.sqrt(p00 * p00 + p10 * p10)
+        if cy > _EPS:
+            az = math.atan2(p10, p00)
+            ax = math.atan2(p21, p22)
+        else:
+            az = 0.0
+            ax = math.atan2(-p12, p11)
+        ay = math.atan2(-p20, cy)
+        out[i, 3] = az * _RAD2DEG
+        out[i, 4] = ay * _RAD2DEG
+        out[i, 5] = ax * _RAD2DEG
+
+
+@njit(cache=True, fastmath=True)
+def dist3(ax, ay, az, bx, by, bz):
+    """
+    Euclidean distance between the points (ax, ay, az) and (bx, by, bz).
+    """
+    dx = ax - bx
+    dy = ay - by
+    dz = az - bz
+
+    return math.sqrt(dx * dx + dy * dy + dz * dz)
+
+
+@njit(cache=True, fastmath=True)
+def norm3(x, y, z):
+    """
+    Length of the 3D vector (x, y, z).
+    """
+    return math.sqrt(x * x + y * y + z * z)
@@ -16,31 +16,126 @@
 #    PARTICULAR. Consulte a Licenca Publica Geral GNU para obter mais
 #    detalhes.
 #--------------------------------------------------------------------------
+import functools
+import math
+import threading
+
 import numpy as np
-import cv2
 from time import time
 
 import transformations as tr
 import constants as const
+import robot._kernels as kernels
+
+# Constant Kalman filter matrices, shared by every KalmanTracker instance.
+_KALMAN_TRANSITION = np.array([[1, 1],
+                               [0, 1]], np.float32)
+_KALMAN_MEASUREMENT = np.array([[1, 1]], np.float32)
+_EYE_2 = np.eye(2, dtype=np.float32)
+
+# Cutoff for the gimbal-lock branch when extracting Euler angles, as in transformations.py.
+_EPS = np.finfo(float).eps * 4.0
+
+# Scalar degree/radian conversion factors; np.radians/np.degrees go through
+# ufunc dispatch even for three scalars.
+_DEG2RAD = math.pi / 180.0
+_RAD2DEG = 180.0 / math.pi
+
+# Per-thread scratch matrices for the transformation hot paths, so every control
+# tick reuses the same two 4x4 buffers instead of allocating fresh ones.
+_scratch = threading.local()
+
+def _scratch_matrices():
+    try:
+        return _scratch.m_build, _scratch.m_result
+    except AttributeError:
+        _scratch.m_build = np.empty((4, 4))
+        _scratch.m_result = np.empty((4, 4))
+        return _scratch.m_build, _scratch.m_result
+
+def _scratch_batch():
+    try:
+        return _scratch.m_batch_build, _scratch.m_batch_result, _scratch.coord_out
+    except AttributeError:
+        _scratch.m_batch_build = np.empty((3, 4, 4))
+        _scratch.m_batch_result = np.empty((3, 4, 4))
+        _scratch.coord_out = np.empty((3, 6), dtype=np.float32)
+        return _scratch.m_batch_build, _scratch.m_batch_result, _scratch.coord_out
+
+@functools.lru_cache(maxsize=8)
+def _parse_axes(axes):
+    """
+    Memoized conversion of an axis-sequence string into the encoded tuple accepted by
+    transformations.py, so the generic fallback paths skip re-parsing it per call.
+    """
+    return tr._AXES2TUPLE[axes] if isinstance(axes, str) else tuple(axes)
+
+def _build_transformation_matrix(ai, aj, ak, position, out=None):
+    """
+    Build the 4x4 matrix combining the rotation Rz(ak) @ Ry(aj) @ Rx(ai) with the given
+    translation. This is the closed form of tr.euler_matrix for the 'sxyz' convention;
+    'rzyx' is the same product with the first and last angles swapped.
+    :param ai, aj, ak: Euler angles in radians about the x, y and z axes.
+    :param position: A vector of three coordinates.
+    :param out: An optional preallocated (4, 4) array to write into.
+    :return: The transformation matrix (4x4).
+    """
+    m_img = np.empty((4, 4)) if out is None else out
+    kernels.build_transformation_matrix(ai, aj, ak,
+                                        position[0], position[1], position[2], m_img)
+
+    return m_img
 
-def coordinates_to_transformation_matrix(position, orientation, axes='sxyz'):
+def coordinates_to_transformation_matrix(position, orientation, axes='sxyz', out=None):
     """
     Transform vectors consisting of position and orientation (in Euler angles) in 3d-space into a 4x4
     transformation matrix that combines the rotation and translation.
     :param position: A vector of three coordinates.
     :param orientation: A vector of three Euler angles in degrees.
     :param axes: The order in which the rotations are done for the axes. See transformations.py for details. Defaults to 'sxyz'.
+    :param out: An optional preallocated (4, 4) array to write into.
     :return: The transformation matrix (4x4).
     """
-    a, b, g = np.radians(orientation)
-
-    r_ref = tr.euler_matrix(a, b, g, axes=axes)
+    a = orientation[0] * _DEG2RAD
+    b = orientation[1] * _DEG2RAD
+    g = orientation[2] * _DEG2RAD
+
+    # The two conventions used in practice are built directly in closed form,
+    # avoiding the generic euler_matrix/translation_matrix/concatenate_matrices chain.
+    if axes == 'sxyz':
+        return _build_transformation_matrix(a, b, g, position, out)
+    if axes == 'rzyx':
+        return _build_transformation_matrix(g, b, a, position, out)
+
+    r_ref = tr.euler_matrix(a, b, g, axes=_parse_axes(axes))
     t_ref = tr.translation_matrix(position)
 
     m_img = tr.concatenate_matrices(t_ref, r_ref)
+    if out is not None:
+        out[:] = m_img
+        return out
 
     return m_img
 
+def _euler_sxyz(matrix):
+    """
+    Extract the Euler angles of the 'sxyz' convention from a transformation matrix, the
+    closed form of tr.euler_from_matrix; 'rzyx' is the same result with the first and
+    last angles swapped.
+    :param matrix: A 4x4 transformation matrix.
+    :return: The three Euler angles in radians.
+    """
+    cy = math.sqrt(matrix[0, 0] * matrix[0, 0] + matrix[1, 0] * matrix[1, 0])
+    ay = math.atan2(-matrix[2, 0], cy)
+    if cy > _EPS:
+        ax = math.atan2(matrix[2, 1], matrix[2, 2])
+        az = math.atan2(matrix[1, 0], matrix[0, 0])
+    else:
+        ax = math.atan2(-matrix[1, 2], matrix[1, 1])
+        az = 0.0
+
+    return ax, ay, az
+
 def transformation_matrix_to_coordinates(matrix, axes='sxyz'):
     """
     Given a matrix that combines the rotation and translation, return the position and the orientation
@@ -50,162 +145,275 @@ def transformation_matrix_to_coordinates(matrix, axes='sxyz'):
     :param axes: The order in which the rotations are done for the axes. See transformations.py for details. Defaults to 'sxyz'.
     :return: The position (a vector of length 3) and Euler angles for the orientation in degrees (a vector of length 3).
     """
-    angles = tr.euler_from_matrix(matrix, axes=axes)
-    angles_as_deg = np.degrees(angles)
+    if axes == 'sxyz':
+        angles = _euler_sxyz(matrix)
+    elif axes == 'rzyx':
+        ax, ay, az = _euler_sxyz(matrix)
+        angles = (az, ay, ax)
+    else:
+        angles = tr.euler_from_matrix(matrix, axes=_parse_axes(axes))
+    angles_as_deg = (angles[0] * _RAD2DEG, angles[1] * _RAD2DEG, angles[2] * _RAD2DEG)
 
-    translation = tr.translation_from_matrix(matrix)
+    translation = np.array(matrix[:3, 3])
 
     return translation, angles_as_deg
 
-def compute_marker_transformation(coord_raw, obj_ref_mode):
+def compute_marker_transformation_flat(coord, out=None):
+    """
+    Variant of compute_marker_transformation taking a flat 6-vector directly, so
+    per-tick callers do not have to wrap a single coordinate into a (1, 6) array.
+    """
     m_probe = coordinates_to_transformation_matrix(
-        position=coord_raw[obj_ref_mode, :3],
-        orientation=coord_raw[obj_ref_mode, 3:],
+        position=coord[:3],
+        orientation=coord[3:6],
         axes='rzyx',
+        out=out,
     )
     return m_probe
 
+def compute_marker_transformation(coord_raw, obj_ref_mode, out=None):
+    return compute_marker_transformation_flat(coord_raw[obj_ref_mode], out=out)
+
 def transformation_tracker_to_robot(m_tracker_to_robot, tracker_coord):
+    m_build, m_result = _scratch_matrices()
     M_tracker = coordinates_to_transformation_matrix(
         position=tracker_coord[:3],
         orientation=tracker_coord[3:6],
         axes='rzyx',
+        out=m_build,
     )
-    M_tracker_in_robot = m_tracker_to_robot @ M_tracker
+    M_tracker_in_robot = np.matmul(m_tracker_to_robot, M_tracker, out=m_result)
 
     translation, angles_as_deg = transformation_matrix_to_coordinates(M_tracker_in_robot, axes='rzyx')
     tracker_in_robot = list(translation) + list(angles_as_deg)
 
     return tracker_in_robot
 
+def _build_rzyx_batch(positions, orientations, out=None):
+    """
+    Build a batch of transformation matrices for the 'rzyx' convention, the batched
+    counterpart of coordinates_to_transformation_matrix.
+    :param positions: An (n, 3) array of translations.
+    :param orientations: An (n, 3) array of Euler angles in degrees.
+    :param out: An optional preallocated (n, 4, 4) array to write into.
+    :return: An (n, 4, 4) array of transformation matrices.
+    """
+    angles = np.radians(orientations)
+    si, sj, sk = np.sin(angles[:, 2]), np.sin(angles[:, 1]), np.sin(angles[:, 0])
+    ci, cj, ck = np.cos(angles[:, 2]), np.cos(angles[:, 1]), np.cos(angles[:, 0])
+    cc, cs = ci * ck, ci * sk
+    sc, ss = si * ck, si * sk
+
+    m = np.empty((len(angles), 4, 4)) if out is None else out
+    m[:, 0, 0] = cj * ck
+    m[:, 0, 1] = sj * sc - cs
+    m[:, 0, 2] = sj * cc + ss
+    m[:, 1, 0] = cj * sk
+    m[:, 1, 1] = sj * ss + cc
+    m[:, 1, 2] = sj * cs - sc
+    m[:, 2, 0] = -sj
+    m[:, 2, 1] = cj * si
+    m[:, 2, 2] = cj * ci
+    m[:, :3, 3] = positions
+    m[:, 3, :3] = 0
+    m[:, 3, 3] = 1
+
+    return m
+
+def _euler_rzyx_batch(matrices, out=None):
+    """
+    Extract the 'rzyx' Euler angles from a batch of transformation matrices, the batched
+    counterpart of tr.euler_from_matrix.
+    :param matrices: An (n, 4, 4) array of transformation matrices.
+    :param out: An optional preallocated (n, 3) array to write into.
+    :return: An (n, 3) array of Euler angles in degrees.
+    """
+    cy = np.sqrt(matrices[:, 0, 0] ** 2 + matrices[:, 1, 0] ** 2)
+    singular = cy <= _EPS
+    if out is None:
+        out = np.empty((len(matrices), 3))
+    out[:, 0] = np.where(singular, 0.0, np.arctan2(matrices[:, 1, 0], matrices[:, 0, 0]))
+    out[:, 1] = np.arctan2(-matrices[:, 2, 0], cy)
+    out[:, 2] = np.where(singular,
+                         np.arctan2(-matrices[:, 1, 2], matrices[:, 1, 1]),
+                         np.arctan2(matrices[:, 2, 1], matrices[:, 2, 2]))
+    out *= _RAD2DEG
+
+    return out
+
 def transform_tracker_to_robot(m_tracker_to_robot, coord_tracker):
-    probe_tracker_in_robot = transformation_tracker_to_robot(m_tracker_to_robot, coord_tracker[0])
-    ref_tracker_in_robot = transformation_tracker_to_robot(m_tracker_to_robot, coord_tracker[1])
-    obj_tracker_in_robot = transformation_tracker_to_robot(m_tracker_to_robot, coord_tracker[2])
+    coord_tracker = np.asarray(coord_tracker, dtype=np.float64)
+    m_batch_build, m_batch_result, coord_out = _scratch_batch()
+
+    if kernels.NUMBA_AVAILABLE:
+        # Build, multiply and decompose all three matrices in one compiled pass.
+        kernels.three_trackers_to_robot(np.asarray(m_tracker_to_robot, dtype=np.float64),
+                                        coord_tracker, coord_out)
+        return coord_out
 
-    if probe_tracker_in_robot is None:
-        probe_tracker_in_robot = coord_tracker[0]
-        ref_tracker_in_robot = coord_tracker[1]
-        obj_tracker_in_robot = coord_tracker[2]
+    M_tracker = _build_rzyx_batch(coord_tracker[:, :3], coord_tracker[:, 3:6], out=m_batch_build)
+    M_tracker_in_robot = np.matmul(m_tracker_to_robot, M_tracker, out=m_batch_result)
 
-    return np.vstack([probe_tracker_in_robot, ref_tracker_in_robot, obj_tracker_in_robot])
+    # Write translation and angles straight into the float32 (3, 6) output
+    # buffer, avoiding the vstack and the float64 intermediate.
+    coord_out[:, :3] = M_tracker_in_robot[:, :3, 3]
+    _euler_rzyx_batch(M_tracker_in_robot, out=coord_out[:, 3:])
+
+    return coord_out
 
 
 class KalmanTracker:
     """
     Kalman filter to avoid sudden fluctuation from tracker device.
     The filter strength can be set by the cov_process, and cov_measure parameter
-    It is required to create one instance for each variable (x, y, z, a, b, g)
+    All variables (x, y, z, a, b, g) are filtered simultaneously as a batch of
+    independent constant-velocity filters, so a single vectorized update
+    replaces six per-variable cv2.KalmanFilter predict/correct calls.
     """
     def __init__(self,
-                 state_num=2,
+                 channel_num=6,
                  covariance_process=0.001,
                  covariance_measure=0.1):
 
-        self.state_num = state_num
-        measure_num = 1
+        self.channel_num = channel_num
 
-        # The filter itself.
-        self.filter = cv2.KalmanFilter(state_num, measure_num, 0)
+        # One position/velocity state per channel.
+        self.state = np.zeros((channel_num, 2), dtype=np.float32)
+        # Error covariance per channel, matching cv2.KalmanFilter's
+        # zero-initialized errorCovPost.
+        self.covariance = np.zeros((channel_num, 2, 2), dtype=np.float32)
 
-        self.state = np.zeros((state_num, 1), dtype=np.float32)
-        self.measurement = np.array((measure_num, 1), np.float32)
-        self.prediction = np.zeros((state_num, 1), np.float32)
+        self.transition_matrix = _KALMAN_TRANSITION
+        self.measurement_matrix = _KALMAN_MEASUREMENT
+        self.process_noise_cov = _EYE_2 * covariance_process
+        self.measurement_noise_cov = np.float32(covariance_measure)
 
+    def update_kalman(self, measurement):
+        measurement = np.asarray(measurement, dtype=np.float32)
 
-        self.filter.transitionMatrix = np.array([[1, 1],
-                                                 [0, 1]], np.float32)
-        self.filter.measurementMatrix = np.array([[1, 1]], np.float32)
-        self.filter.processNoiseCov = np.array([[1, 0],
-                                                [0, 1]], np.float32) * covariance_process
-        self.filter.measurementNoiseCov = np.array([[1]], np.float32) * covariance_measure
+        # Predict: x = F x (F = [[1, 1], [0, 1]]), P = F P F' + Q.
+        self.state[:, 0] += self.state[:, 1]
+        covariance = (self.transition_matrix @ self.covariance @ self.transition_matrix.T
+                      + self.process_noise_cov)
 
-    def update_kalman(self, measurement):
-        self.prediction = self.filter.predict()
-        self.measurement = np.array([[np.float32(measurement[0])]])
+        # Correct with H = [1, 1]: the innovation covariance is a scalar per
+        # channel, so the gain and updates reduce to elementwise operations.
+        gain_num = covariance.sum(axis=2)                                 # P H'
+        innovation_cov = gain_num.sum(axis=1) + self.measurement_noise_cov  # H P H' + R
+        gain = gain_num / innovation_cov[:, np.newaxis]
+        innovation = measurement - self.state.sum(axis=1)                 # z - H x
+        self.state += gain * innovation[:, np.newaxis]
+        self.covariance = covariance - gain[:, :, np.newaxis] * covariance.sum(axis=1)[:, np.newaxis, :]
 
-        self.filter.correct(self.measurement)
-        self.state = self.filter.statePost
+        # A view into the live filter state, valid until the next update;
+        # callers consume it within the tick, so no per-call copy is needed.
+        return self.state[:, 0]
 
 
 class TrackerProcessing:
     def __init__(self):
-        self.coord_vel = []
-        self.timestamp = []
-        self.velocity_vector = []
-        self.kalman_coord_vector = []
+        # Fixed-size ring buffers with write counters. Python lists with
+        # append + del list[0] shift every element each tick and the stats
+        # computations had to copy the whole list into a new array.
+        self._coord_vel = np.empty((10, 6), dtype=np.float32)
+        self._timestamp = np.empty(10)
+        self._velocity_vector = np.empty((30, 6), dtype=np.float32)
+        self._coord_vel_count = 0
+        self._velocity_count = 0
+        self._kalman_warmup = 0
+        # Running sums over the velocity window, so the std is O(1) per tick
+        # instead of a scan over the whole buffer.
+        self._velocity_sum = np.zeros(6)
+        self._velocity_sum_sq = np.zeros(6)
         self.velocity_std = 0
         self.m_tracker_to_robot = None
         self.matrix_tracker_fiducials = 3*[None]
+        self._ear_center_fiducial = None
 
-        self.tracker_stabilizers = [KalmanTracker(
-            state_num=2,
+        self.tracker_stabilizers = KalmanTracker(
+            channel_num=6,
             covariance_process=0.001,
-            covariance_measure=0.1) for _ in range(6)]
+            covariance_measure=0.1)
 
     def SetMatrixTrackerFiducials(self, matrix_tracker_fiducials):
         self.matrix_tracker_fiducials = matrix_tracker_fiducials
+        m_probe_head_left, m_probe_head_right, m_probe_head_nasion = matrix_tracker_fiducials
+        # Only the translation column of the ear fiducials matters for the head
+        # center, and averaging commutes with the rigid transformation, so the
+        # midpoint between the ears is fixed in the head marker frame.
+        self._ear_center_fiducial = (np.asarray(m_probe_head_left)[:3, 3]
+                                     + np.asarray(m_probe_head_right)[:3, 3]) / 2
 
     def kalman_filter(self, coord_tracker):
-        kalman_array = []
         pose_np = np.array((coord_tracker[:3], coord_tracker[3:])).flatten()
-        for value, ps_stb in zip(pose_np, self.tracker_stabilizers):
-            ps_stb.update_kalman([value])
-            kalman_array.append(ps_stb.state[0])
-        coord_kalman = np.hstack(kalman_array)
-
-        self.kalman_coord_vector.append(coord_kalman[:3])
-        if len(self.kalman_coord_vector) < 20: #avoid initial fluctuations
-            coord_kalman = coord_tracker
+
+        if self._kalman_warmup < 20: #avoid initial fluctuations
+            # Seed the filter with the raw pose instead of running
+            # predict/correct only to discard the result.
+            self.tracker_stabilizers.state[:, 0] = pose_np
+            self._kalman_warmup += 1
             print('initializing filter')
-        else:
-            del self.kalman_coord_vector[0]
+            return coord_tracker
 
-        return coord_kalman
+        return self.tracker_stabilizers.update_kalman(pose_np)
 
-    def estimate_head_velocity(self, coord_vel, timestamp):
-        coord_vel = np.vstack(np.array(coord_vel))
-        coord_init = coord_vel[:int(len(coord_vel) / 2)].mean(axis=0)
-        coord_final = coord_vel[int(len(coord_vel) / 2):].mean(axis=0)
-        velocity = (coord_final - coord_init)/(timestamp[-1] - timestamp[0])
+    def estimate_head_velocity(self, coord_vel, timestamp, oldest=0):
+        """
+        Estimates the head velocity from a sample window by comparing the means of its
+        older and newer halves. The buffers may be ring buffers; 'oldest' is the index
+        of the chronologically first sample.
+        """
+        coord_vel = np.asarray(coord_vel)
+        n = len(coord_vel)
+        half = n // 2
+        end = oldest + half
+        # Both half-sums come out of a single np.add.reduceat pass over the
+        # buffer, split at the points where the halves begin and wrap.
+        if oldest == 0:
+            sums = np.add.reduceat(coord_vel, (0, half), axis=0)
+            init_sum, final_sum = sums[0], sums[1]
+        elif end < n:
+            sums = np.add.reduceat(coord_vel, (0, oldest, end), axis=0)
+            init_sum = sums[1]
+            final_sum = sums[0] + sums[2]
+        elif end == n:
+            sums = np.add.reduceat(coord_vel, (0, oldest), axis=0)
+            init_sum, final_sum = sums[1], sums[0]
+        else:  # the older half wraps around the end of the buffer
+            sums = np.add.reduceat(coord_vel, (0, end - n, oldest), axis=0)
+            init_sum = sums[0] + sums[2]
+            final_sum = sums[1]
+        coord_init = init_sum / half
+        coord_final = final_sum / (n - half)
+        velocity = (coord_final - coord_init)/(timestamp[oldest - 1] - timestamp[oldest])
         distance = (coord_final - coord_init)
 
         return velocity, distance
 
     def compute_versors(self, init_point, final_point):
-        init_point = np.array(init_point)
-        final_point = np.array(final_point)
-        norm = (sum((final_point - init_point) ** 2)) ** 0.5
-        versor_factor = (((final_point-init_point) / norm) * const.ROBOT_VERSOR_SCALE_FACTOR).tolist()
+        deltas = [final - init for final, init in zip(final_point, init_point)]
+        factor = const.ROBOT_VERSOR_SCALE_FACTOR / math.sqrt(sum(delta * delta for delta in deltas))
 
-        return versor_factor
+        return [delta * factor for delta in deltas]
 
     def compute_arc_motion(self, current_robot_coordinates, head_center_coordinates, new_robot_coordinates):
-        head_center = head_center_coordinates[0], head_center_coordinates[1], head_center_coordinates[2], \
-                      new_robot_coordinates[3], new_robot_coordinates[4], new_robot_coordinates[5]
-
-        versor_factor_move_out = self.compute_versors(head_center, current_robot_coordinates)
-        init_move_out_point = current_robot_coordinates[0] + versor_factor_move_out[0], \
-                              current_robot_coordinates[1] + versor_factor_move_out[1], \
-                              current_robot_coordinates[2] + versor_factor_move_out[2], \
-                              current_robot_coordinates[3], current_robot_coordinates[4], current_robot_coordinates[5]
-
-        middle_point = ((new_robot_coordinates[0] + current_robot_coordinates[0]) / 2,
-                        (new_robot_coordinates[1] + current_robot_coordinates[1]) / 2,
-                        (new_robot_coordinates[2] + current_robot_coordinates[2]) / 2,
-                        0, 0, 0)
-        versor_factor_middle_arc = (np.array(self.compute_versors(head_center, middle_point))) * 2
-        middle_arc_point = middle_point[0] + versor_factor_middle_arc[0], \
-                           middle_point[1] + versor_factor_middle_arc[1], \
-                           middle_point[2] + versor_factor_middle_arc[2]
-
-        versor_factor_arc = self.compute_versors(head_center, new_robot_coordinates)
-        final_ext_arc_point = new_robot_coordinates[0] + versor_factor_arc[0], \
-                              new_robot_coordinates[1] + versor_factor_arc[1], \
-                              new_robot_coordinates[2] + versor_factor_arc[2], \
-                              new_robot_coordinates[3], new_robot_coordinates[4], new_robot_coordinates[5], 0
-
-        target_arc = middle_arc_point + final_ext_arc_point
+        current = np.asarray(current_robot_coordinates, dtype=np.float64)
+        new = np.asarray(new_robot_coordinates, dtype=np.float64)
+
+        head_center = np.concatenate([np.asarray(head_center_coordinates, dtype=np.float64)[:3],
+                                      new[3:6]])
+        middle_point = np.concatenate([(new[:3] + current[:3]) / 2, np.zeros(3)])
+
+        # The move out, middle arc and arc versors in one batched computation.
+        final_points = np.stack([current, middle_point, new])
+        diff = final_points - head_center
+        norms = np.linalg.norm(diff, axis=1, keepdims=True)
+        versor_factor = diff / norms * const.ROBOT_VERSOR_SCALE_FACTOR
+
+        init_move_out_point = np.concatenate([current[:3] + versor_factor[0, :3], current[3:6]])
+        middle_arc_point = middle_point[:3] + 2 * versor_factor[1, :3]
+        final_ext_arc_point = np.concatenate([new[:3] + versor_factor[2, :3], new[3:6], [0]])
+        target_arc = np.concatenate([middle_arc_point, final_ext_arc_point])
 
         return init_move_out_point, target_arc
 
@@ -213,18 +421,30 @@ class TrackerProcessing:
         """
         Checks if the head velocity is bellow the threshold
         """
-        self.coord_vel.append(current_ref)
-        self.timestamp.append(time())
-        if len(self.coord_vel) >= 10:
-            head_velocity, head_distance = self.estimate_head_velocity(self.coord_vel, self.timestamp)
-            self.velocity_vector.append(head_velocity)
-
-            del self.coord_vel[0]
-            del self.timestamp[0]
-
-            if len(self.velocity_vector) >= 30:
-                self.velocity_std = np.std(self.velocity_vector)
-                del self.velocity_vector[0]
+        index = self._coord_vel_count % 10
+        self._coord_vel[index] = current_ref
+        self._timestamp[index] = time()
+        self._coord_vel_count += 1
+        if self._coord_vel_count >= 10:
+            head_velocity, head_distance = self.estimate_head_velocity(
+                self._coord_vel, self._timestamp, oldest=self._coord_vel_count % 10)
+            slot = self._velocity_count % 30
+            if self._velocity_count >= 30:
+                evicted = self._velocity_vector[slot]
+                self._velocity_sum -= evicted
+                self._velocity_sum_sq -= evicted * evicted
+            self._velocity_vector[slot] = head_velocity
+            # Add the stored (float32-rounded) row so additions and evictions
+            # cancel exactly.
+            stored = self._velocity_vector[slot]
+            self._velocity_sum += stored
+            self._velocity_sum_sq += stored * stored
+            self._velocity_count += 1
+
+            if self._velocity_count >= 30:
+                n = self._velocity_vector.size
+                variance = self._velocity_sum_sq.sum() / n - (self._velocity_sum.sum() / n) ** 2
+                self.velocity_std = math.sqrt(max(variance, 0.0))
 
             if self.velocity_std > const.ROBOT_HEAD_VELOCITY_THRESHOLD:
                 print('Velocity threshold activated')
@@ -238,12 +458,14 @@ class TrackerProcessing:
         """
         Estimates the new robot position to reach the target
         """
+        m_build, m_result = _scratch_matrices()
         M_current_head = coordinates_to_transformation_matrix(
             position=current_head[:3],
             orientation=current_head[3:6],
             axes='rzyx',
+            out=m_build,
         )
-        m_robot_new = M_current_head @ m_change_robot_to_head
+        m_robot_new = np.matmul(M_current_head, m_change_robot_to_head, out=m_result)
 
         translation, angles_as_deg = transformation_matrix_to_coordinates(m_robot_new, axes='sxyz')
         new_robot_position = list(translation) + list(angles_as_deg)
@@ -254,28 +476,20 @@ class TrackerProcessing:
         """
         Estimates the actual head center position using fiducials
         """
-        m_probe_head_left, m_probe_head_right, m_probe_head_nasion = self.matrix_tracker_fiducials
-        m_current_head = compute_marker_transformation(np.array([current_head]), 0)
-
-        m_ear_left_new = m_current_head @ m_probe_head_left
-        m_ear_right_new = m_current_head @ m_probe_head_right
+        m_build, m_result = _scratch_matrices()
+        m_current_head = compute_marker_transformation_flat(current_head, out=m_build)
 
-        return (m_ear_left_new[:3, -1] + m_ear_right_new[:3, -1])/2
+        return m_current_head[:3, :3] @ self._ear_center_fiducial + m_current_head[:3, 3]
 
     def correction_distance_calculation_target(self, coord_inv, actual_point):
         """
         Estimates the Euclidean distance between the actual position and the target
         """
-        correction_distance_compensation = np.sqrt((coord_inv[0]-actual_point[0]) ** 2 +
-                                                   (coord_inv[1]-actual_point[1]) ** 2 +
-                                                   (coord_inv[2]-actual_point[2]) ** 2)
-
-        return correction_distance_compensation
+        return kernels.dist3(coord_inv[0], coord_inv[1], coord_inv[2],
+                             actual_point[0], actual_point[1], actual_point[2])
 
     def estimate_robot_target_length(self, robot_target):
         """
         Estimates the length of the 3D vector of the robot target
         """
-        robot_target_length = np.sqrt(robot_target[0] ** 2 + robot_target[1] ** 2 + robot_target[2] ** 2)
-
-        return robot_target_length
+        return kernels.norm3(robot_target[0], robot_target[1], robot_target[2])